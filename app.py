@@ -1,16 +1,62 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, get_flashed_messages, session
+from flask.sessions import SecureCookieSessionInterface
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy import func, case, insert, update, select, event, inspect, table, column
+from flask_caching import Cache
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from datetime import datetime, date, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+import enum
+import hashlib
+import hmac
 import os
+import uuid
+
+class SHA256SessionInterface(SecureCookieSessionInterface):
+    # HMAC-SHA256 instead of Flask's default SHA-1 for the session cookie signature
+    digest_method = staticmethod(hashlib.sha256)
 
 app = Flask(__name__)
+app.session_interface = SHA256SessionInterface()
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'super-secret-key')
+# Set SESSION_COOKIE_SECURE=0 to run over plain HTTP outside localhost
+app.config['SESSION_COOKIE_SECURE'] = os.environ.get('SESSION_COOKIE_SECURE', '1') == '1'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-db = SQLAlchemy(app)
+# One warm pooled connection per gunicorn thread; writers wait on the lock instead of failing
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': int(os.environ.get('GUNICORN_THREADS', '8')),
+    'pool_pre_ping': False,
+    'connect_args': {'timeout': 30},
+}
+# Request-scoped objects stay usable after commit instead of being re-SELECTed
+db = SQLAlchemy(app, session_options={'expire_on_commit': False})
+
+# WAL lets dashboard reads run alongside writes; NORMAL sync skips the fsync on every commit
+with app.app_context():
+    @event.listens_for(db.engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA mmap_size=268435456')
+        cursor.execute('PRAGMA cache_size=-64000')
+        cursor.close()
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
+# SimpleCache is per worker process; point CACHE_TYPE at a shared backend when scaling out
+app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'SimpleCache')
+cache = Cache(app)
+
+# Argon2id hasher: the memory-hard loop runs in C with the GIL released
+ph = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+# Verified against for unknown usernames so they cost the same as a wrong password
+DUMMY_PASSWORD_HASH = ph.hash('dummy-password')
 
 # ================= MODELS =================
 class User(UserMixin, db.Model):
@@ -23,18 +69,213 @@ class User(UserMixin, db.Model):
     current_streak = db.Column(db.Integer, default=0)
     last_login_date = db.Column(db.Date, nullable=True)
 
+    tasks = db.relationship('Task', back_populates='user', order_by='Task.id')
+
+class Priority(enum.IntEnum):
+    LOW = 0
+    NORMAL = 1
+    HIGH = 2
+
+    @property
+    def label(self):
+        return self.name.title()
+
+    @classmethod
+    def from_label(cls, label):
+        # Form values are 'High' / 'Normal' / 'Low'; anything else falls back to Normal
+        return cls.__members__.get((label or '').upper(), cls.NORMAL)
+
+class PriorityType(db.TypeDecorator):
+    # Stored as a SMALLINT, loaded back as a Priority
+    impl = db.SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else int(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # Old VARCHAR columns may still return labels ('High') or numbers as text ('2')
+        if isinstance(value, str) and not value.isdigit():
+            return Priority.from_label(value)
+        return Priority(int(value))
+
 class Task(db.Model):
+    # Dashboard lists and the free-tier active count both filter on these
+    __table_args__ = (
+        db.Index('ix_task_user_completed', 'user_id', 'is_completed'),
+        db.CheckConstraint('priority BETWEEN 0 AND 2', name='ck_task_priority'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     due_date = db.Column(db.Date, nullable=True)
-    priority = db.Column(db.String(50), default='Normal') # High, Normal, Low
+    priority = db.Column(PriorityType, default=Priority.NORMAL)
     category = db.Column(db.String(100), nullable=True)
     is_completed = db.Column(db.Boolean, default=False)
 
+    user = db.relationship('User', back_populates='tasks')
+
+# Premium search index: FTS5 table over task titles, kept in sync by triggers
+task_fts = table('task_fts', column('rowid'), column('task_fts'))
+
+TASK_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5("
+    "title, content='task', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_ai AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_fts(rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_ad AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_au AFTER UPDATE OF title ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+    "INSERT INTO task_fts(rowid, title) VALUES (new.id, new.title); END",
+)
+
+def ensure_task_fts(connection):
+    # Idempotent: safe on every startup and on databases that predate the search index
+    for ddl in TASK_FTS_DDL:
+        connection.exec_driver_sql(ddl)
+    # The triggers only cover later writes, so rebuild until every task has an index entry
+    indexed = connection.exec_driver_sql('SELECT count(*) FROM task_fts_docsize').scalar()
+    total = connection.exec_driver_sql('SELECT count(*) FROM task').scalar()
+    if indexed != total:
+        connection.exec_driver_sql("INSERT INTO task_fts(task_fts) VALUES ('rebuild')")
+
+def migrate_legacy_priorities(connection):
+    # Tasks written before the SMALLINT column stored 'High' / 'Normal' / 'Low' labels
+    connection.exec_driver_sql(
+        "UPDATE task SET priority = CASE priority WHEN 'High' THEN 2 WHEN 'Low' THEN 0 ELSE 1 END "
+        "WHERE typeof(priority) = 'text' AND priority NOT IN ('0', '1', '2')")
+
+@event.listens_for(Task.__table__, 'after_create')
+def create_task_fts(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        ensure_task_fts(connection)
+
+def fts_match_expression(search_query):
+    # Quote each word so user input is never parsed as FTS syntax; '*' keeps prefix matching
+    return ' '.join('"%s"*' % word.replace('"', '""') for word in search_query.split())
+
+# Short TTL also bounds staleness from writes that bypass login/subscribe (manual DB edits)
+USER_CACHE_TIMEOUT = 60
+
+def user_cache_key(user_id):
+    return 'user:%d' % user_id
+
+def cache_user(user):
+    # Profile fields only; the password hash never leaves the database
+    cache.set(user_cache_key(user.id), {
+        'id': user.id,
+        'username': user.username,
+        'is_premium': user.is_premium,
+        'current_streak': user.current_streak,
+        'last_login_date': user.last_login_date,
+    }, timeout=USER_CACHE_TIMEOUT)
+
+def uncache_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    cached = cache.get(user_cache_key(int(user_id)))
+    if cached:
+        user = User(**cached)
+        # Attach as a persistent row; anything not cached (password, tasks) loads on access
+        make_transient_to_detached(user)
+        db.session.add(user)
+        return user
+
+    user = User.query.get(int(user_id))
+    if user:
+        cache_user(user)
+    return user
+
+def verify_legacy_sha256(hashed_pw, password):
+    # Werkzeug < 2.3 method='sha256' stored 'sha256$<salt>$<hex HMAC-SHA256(salt, password)>'
+    _, salt, expected = hashed_pw.split('$', 2)
+    actual = hmac.new(salt.encode(), password.encode(), hashlib.sha256).hexdigest()
+    return safe_eq(actual, expected)
+
+def verify_password(hashed_pw, password):
+    try:
+        return ph.verify(hashed_pw, password)
+    except InvalidHashError:
+        pass
+    except VerificationError:
+        return False
+    # Accounts created before the switch to Argon2 still hold Werkzeug hashes
+    try:
+        if hashed_pw.startswith('sha256$'):
+            return verify_legacy_sha256(hashed_pw, password)
+        return check_password_hash(hashed_pw, password)
+    except ValueError:
+        return False # Unreadable stored hash: report invalid credentials, not a 500
+
+def safe_eq(a, b):
+    # Constant-time comparison for secrets (activation codes, tokens); never use == on these
+    if isinstance(a, str):
+        a = a.encode()
+    if isinstance(b, str):
+        b = b.encode()
+    return hmac.compare_digest(a, b)
+
+def password_needs_rehash(hashed_pw):
+    try:
+        return ph.check_needs_rehash(hashed_pw)
+    except InvalidHashError:
+        return True # Legacy Werkzeug hash
+
+def bump_tasks_version(user_id):
+    # Changing a user's tasks moves their dashboard to a fresh cache key. A random token
+    # (not a counter) can never repeat, even after the entry is evicted.
+    version = uuid.uuid4().hex
+    cache.set('tasks_version:%d' % user_id, version, timeout=0)
+    return version
+
+def dashboard_cache_key():
+    version = cache.get('tasks_version:%d' % current_user.id)
+    if version is None:
+        version = bump_tasks_version(current_user.id)
+    return 'dashboard:%d:%s' % (current_user.id, version)
+
+def skip_dashboard_cache():
+    # Premium pages vary with search/focus/analytics; pending flashes must render exactly once
+    return current_user.is_premium or '_flashes' in session
+
+def add_tasks_bulk(user_id, rows):
+    # One executemany INSERT and one commit for the whole batch (imports, recurring tasks)
+    if not rows:
+        return
+    db.session.execute(insert(Task), [
+        {'title': row['title'],
+         'priority': Priority.from_label(row.get('priority')),
+         'category': row.get('category', 'General'),
+         'due_date': row.get('due_date'),
+         'user_id': user_id}
+        for row in rows
+    ])
+    db.session.commit()
+    bump_tasks_version(user_id)
+
+# Gunicorn never runs create_all(), so bring an existing database up to date here
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite' and inspect(db.engine).has_table('task'):
+        task_columns = {c['name'] for c in inspect(db.engine).get_columns('task')}
+        with db.engine.begin() as connection:
+            if {'user_id', 'is_completed'} <= task_columns:
+                connection.exec_driver_sql(
+                    'CREATE INDEX IF NOT EXISTS ix_task_user_completed ON task (user_id, is_completed)')
+            if 'priority' in task_columns:
+                migrate_legacy_priorities(connection)
+        if 'title' in task_columns:
+            try:
+                with db.engine.begin() as connection:
+                    ensure_task_fts(connection)
+            except DBAPIError:
+                # Only premium search needs the index: keep serving and retry on the next start
+                app.logger.exception('Could not build the task search index')
 
 # ================= ROUTES =================
 
@@ -48,14 +289,22 @@ def register():
         username = request.form.get('username')
         password = request.form.get('password')
         
-        if User.query.filter_by(username=username).first():
-            flash('Username already exists.')
+        if not username or not password:
+            flash('Username and password are required.')
             return redirect(url_for('register'))
             
-        hashed_pw = generate_password_hash(password, method='sha256')
+        hashed_pw = ph.hash(password)
         new_user = User(username=username, password=hashed_pw)
         db.session.add(new_user)
-        db.session.commit()
+        # The UNIQUE constraint on username does the duplicate check in the INSERT itself
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if 'UNIQUE constraint failed: user.username' not in str(e.orig):
+                raise
+            flash('Username already exists.')
+            return redirect(url_for('register'))
         return redirect(url_for('login'))
     return render_template('register.html')
 
@@ -63,20 +312,31 @@ def register():
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
-        password = request.form.get('password')
+        password = request.form.get('password', '')
         user = User.query.filter_by(username=username).first()
+        valid = verify_password(user.password if user else DUMMY_PASSWORD_HASH, password)
         
-        if user and check_password_hash(user.password, password):
+        if user and valid:
             login_user(user)
             
-            # Premium Feature: Update Streak on Login
+            # Premium Feature: Update Streak on Login (one UPDATE, RETURNING refreshes `user`)
             today = date.today()
-            if user.last_login_date == today - timedelta(days=1):
-                user.current_streak += 1
-            elif user.last_login_date != today:
-                user.current_streak = 1 # Reset if they missed a day
-            user.last_login_date = today
+            user = db.session.execute(
+                update(User)
+                .where(User.id == user.id)
+                .values(current_streak=case(
+                            (User.last_login_date == today - timedelta(days=1), User.current_streak + 1),
+                            (User.last_login_date == today, User.current_streak),
+                            else_=1), # Reset if they missed a day
+                        last_login_date=today)
+                .returning(User)
+                .execution_options(synchronize_session=False, populate_existing=True)
+            ).scalar_one()
+            # Upgrade legacy or weaker hashes while the plaintext is at hand
+            if password_needs_rehash(user.password):
+                user.password = ph.hash(password)
             db.session.commit()
+            uncache_user(user.id)
             
             return redirect(url_for('dashboard'))
         flash('Invalid credentials')
@@ -90,65 +350,83 @@ def logout():
 
 @app.route('/dashboard')
 @login_required
+@cache.cached(timeout=30, make_cache_key=dashboard_cache_key, unless=skip_dashboard_cache)
 def dashboard():
+    # Free tier: a short list, rendered once and then served from the page cache
+    if not current_user.is_premium:
+        return render_template('dashboard.html', tasks=current_user.tasks, completion_rate=0)
+
     query = Task.query.filter_by(user_id=current_user.id)
     
     # Premium Feature: Smart Focus & Search/Filter
-    if current_user.is_premium:
-        search_query = request.args.get('search')
-        focus_mode = request.args.get('focus')
-        
-        if search_query:
-            query = query.filter(Task.title.contains(search_query))
-        if focus_mode == 'true':
-            query = query.filter_by(priority='High')
-
-    tasks = query.all()
+    search_query = request.args.get('search')
+    focus_mode = request.args.get('focus')
+    
+    if search_query and search_query.strip():
+        matches = select(task_fts.c.rowid).where(
+            task_fts.c.task_fts.op('MATCH')(fts_match_expression(search_query)))
+        query = query.filter(Task.id.in_(matches))
+    if focus_mode == 'true':
+        query = query.filter_by(priority=Priority.HIGH)
     
-    # Premium Feature: Analytics
-    total_tasks = len(tasks)
-    completed_tasks = len([t for t in tasks if t.is_completed])
+    # Premium Feature: Analytics (aggregated by SQLite, not over the fetched rows)
+    total_tasks, completed_tasks = query.with_entities(
+        func.count(Task.id),
+        func.coalesce(func.sum(case((Task.is_completed, 1), else_=0)), 0),
+    ).one()
     completion_rate = round((completed_tasks / total_tasks * 100), 1) if total_tasks > 0 else 0
 
-    return render_template('dashboard.html', 
-                           tasks=tasks, 
+    # Streamed bodies render after the session cookie is sent, so pop flashes now
+    get_flashed_messages(with_categories=True)
+    # Rows are fetched 100 at a time while the page is sent, never held in memory at once
+    return stream_template('dashboard.html',
+                           tasks=query.order_by(Task.id).yield_per(100),
                            completion_rate=completion_rate)
 
 @app.route('/add_task', methods=['POST'])
 @login_required
 def add_task():
     # FREE TIER LIMIT: Max 5 active tasks
-    active_tasks_count = Task.query.filter_by(user_id=current_user.id, is_completed=False).count()
-    
-    if not current_user.is_premium and active_tasks_count >= 5:
-        flash('Free limit reached (5 active tasks). Upgrade to Premium to add more!', 'warning')
-        return redirect(url_for('subscribe'))
+    if not current_user.is_premium:
+        active_tasks_count = db.session.query(func.count(Task.id)).filter_by(
+            user_id=current_user.id, is_completed=False).scalar()
+        if active_tasks_count >= 5:
+            flash('Free limit reached (5 active tasks). Upgrade to Premium to add more!', 'warning')
+            return redirect(url_for('subscribe'))
         
     title = request.form.get('title')
-    priority = request.form.get('priority', 'Normal')
+    priority = Priority.from_label(request.form.get('priority'))
     category = request.form.get('category', 'General')
     
     new_task = Task(title=title, priority=priority, category=category, user_id=current_user.id)
     db.session.add(new_task)
     db.session.commit()
+    bump_tasks_version(current_user.id)
     return redirect(url_for('dashboard'))
 
 @app.route('/complete_task/<int:task_id>')
 @login_required
 def complete_task(task_id):
-    task = Task.query.get(task_id)
-    if task and task.user_id == current_user.id:
-        task.is_completed = not task.is_completed # Toggle completion
-        db.session.commit()
+    # Toggle completion in one statement; the user_id predicate enforces ownership
+    result = db.session.execute(
+        update(Task)
+        .where(Task.id == task_id, Task.user_id == current_user.id)
+        .values(is_completed=~Task.is_completed)
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+    if result.rowcount:
+        bump_tasks_version(current_user.id)
     return redirect(url_for('dashboard'))
 
 @app.route('/subscribe', methods=['GET', 'POST'])
 @login_required
 def subscribe():
-    # Mock payment/upgrade route
+    # Mock payment/upgrade route. A real activation code or payment token check
+    # must go through safe_eq(), not ==, so response time leaks nothing about the secret.
     if request.method == 'POST':
         current_user.is_premium = True
         db.session.commit()
+        uncache_user(current_user.id)
         flash('Welcome to Premium! 💎', 'success')
         return redirect(url_for('dashboard'))
     return render_template('subscribe.html')
@@ -3,3 +3,10 @@ import os
 # Ensure the server listens on the platform-provided port.
 bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
 
+# Threaded workers: Argon2 hashing and SQLite I/O release the GIL, so one
+# process overlaps logins and queries across threads. Extra processes each
+# get their own SimpleCache, so raise WEB_CONCURRENCY only with a shared
+# CACHE_TYPE backend.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))